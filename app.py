@@ -1,9 +1,11 @@
+import io
 import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
 import pydeck as pdk
-from utils import load_delivery_data, compute_distances, estimate_emissions
-from sklearn.linear_model import LinearRegression
+import pyarrow as pa
+import pyarrow.csv as pv
+from utils import load_delivery_data, read_uploaded_data, compute_distances, estimate_emissions
 import numpy as np
 
 st.set_page_config(page_title="GreenRetailAI", layout="wide")
@@ -22,70 +24,112 @@ theme = st.sidebar.selectbox("🎨 Theme", ["Light", "Dark"])
 map_style = "mapbox://styles/mapbox/dark-v9" if theme == "Dark" else "mapbox://styles/mapbox/light-v9"
 
 # Load and process data
+@st.cache_data(max_entries=4)
+def _load_with_distances(file_bytes: bytes | None, nrows: int) -> pd.DataFrame:
+    df = read_uploaded_data(io.BytesIO(file_bytes)) if file_bytes is not None else load_delivery_data(nrows=nrows)
+    df = compute_distances(df)
+    return df
+
+# Not cached: the filter and emissions kernel are cheap, and caching per slider range grows without bound
+def _load_and_process(file_bytes: bytes | None, nrows: int, distance_range: tuple[int, int]) -> pd.DataFrame:
+    df = _load_with_distances(file_bytes, nrows)
+    # Filter before estimating emissions so only the kept rows are processed
+    dist = df["distance_km"].to_numpy()
+    mask = (dist >= distance_range[0]) & (dist <= distance_range[1])
+    if not mask.all():
+        df = df[mask].reset_index(drop=True)
+    df = estimate_emissions(df)
+    return df
+
+def _fit_co2_trend(x: np.ndarray, y: np.ndarray) -> tuple[float, float]:
+    xm = x.mean()
+    ym = y.mean()
+    denom = ((x - xm) ** 2).sum()
+    # Constant x (e.g. a single row left by the filter): flat line through mean(y)
+    slope = 0.0 if denom == 0 else ((x - xm) * (y - ym)).sum() / denom
+    intercept = ym - slope * xm
+    return float(slope), float(intercept)
+
+@st.cache_data(max_entries=4)
+def _to_csv_bytes(df: pd.DataFrame) -> bytes:
+    buf = io.BytesIO()
+    pv.write_csv(pa.Table.from_pandas(df, preserve_index=False), buf)
+    return buf.getvalue()
+
 try:
     with st.spinner("🔄 Loading and processing..."):
-        df = pd.read_csv(uploaded_file) if uploaded_file else load_delivery_data(nrows=nrows)
-        df = compute_distances(df)
-        df = estimate_emissions(df)
-        df = df[(df["distance_km"] >= distance_filter[0]) & (df["distance_km"] <= distance_filter[1])]
+        df = _load_and_process(uploaded_file.getvalue() if uploaded_file is not None else None, nrows, distance_filter)
     st.success("✅ Data loaded successfully!")
 except Exception as e:
     st.error(f"❌ Error: {e}")
     st.stop()
 
+# EV-suitability mask shared by the sections below
+ev_mask = df["suggest_ev"].to_numpy()
+n_ev = int(ev_mask.sum())
+n_total = len(df)
+ev_co2_total = float(df["co2_kg"].to_numpy()[ev_mask].sum())
+
 # 🔢 KPIs
 col1, col2, col3 = st.columns(3)
 col1.metric("🌍 CO₂ Emissions (kg)", f"{df['co2_kg'].sum():,.2f}")
-col2.metric("⚡ EV-Friendly Deliveries", f"{df['suggest_ev'].sum():,}")
+col2.metric("⚡ EV-Friendly Deliveries", f"{n_ev:,}")
 col3.metric("📏 Avg. Distance (km)", f"{df['distance_km'].mean():.2f}")
 
 # 📊 EV Transition Impact Simulator
 st.markdown("### ⚙️ EV Transition Impact Simulator")
 ev_slider = st.slider("Assumed % EV adoption for <10 km", 0, 100, 50)
-simulated_saving = df[df["suggest_ev"]]["co2_kg"].sum() * (ev_slider / 100)
+simulated_saving = ev_co2_total * (ev_slider / 100)
 st.success(f"🌱 Potential CO₂ Saved: **{simulated_saving:,.2f} kg**")
 
 # 📉 Before vs After EV Adoption
 st.markdown("### 📉 CO₂ Emissions: Before vs After EV Adoption")
 before = df["co2_kg"].sum()
 after = before - simulated_saving
-fig_bar, ax_bar = plt.subplots()
-ax_bar.bar(["Before", "After EV Adoption"], [before, after], color=["red", "green"])
-ax_bar.set_ylabel("Total CO₂ (kg)")
-st.pyplot(fig_bar)
+before_after = pd.DataFrame({
+    "Scenario": ["Before", "After EV Adoption"],
+    "Total CO₂ (kg)": [before, after],
+    "color": ["#FF0000", "#008000"],
+})
+st.bar_chart(before_after, x="Scenario", y="Total CO₂ (kg)", color="color", sort=False)
 
 # 🥧 EV Suitability Breakdown
 st.markdown("### 🥧 EV Suitability Breakdown")
 ev_labels = ['EV-suitable (<10km)', 'Not EV-Suitable']
-ev_values = [df[df["suggest_ev"]].shape[0], df[~df["suggest_ev"]].shape[0]]
+ev_values = [n_ev, n_total - n_ev]
 fig2, ax2 = plt.subplots()
 ax2.pie(ev_values, labels=ev_labels, autopct='%1.1f%%', colors=["#4CAF50", "#FF7043"])
 st.pyplot(fig2)
 
 # 📈 Histogram of CO2 Emissions
 st.markdown("### 📈 CO₂ Emissions Histogram")
-fig, ax = plt.subplots()
-df["co2_kg"].hist(bins=40, ax=ax, color="green", edgecolor='black')
-ax.set_xlabel("CO₂ Emissions (kg)")
-ax.set_ylabel("Deliveries")
-st.pyplot(fig)
+counts, edges = np.histogram(df["co2_kg"].to_numpy(), bins=40)
+centers = 0.5 * (edges[:-1] + edges[1:])
+# Round labels to one digit finer than the bin width so neighbouring bins stay distinct
+decimals = max(0, int(-np.floor(np.log10(edges[1] - edges[0]))) + 1)
+hist_df = pd.DataFrame({"Deliveries": counts}, index=pd.Index(centers.round(decimals), name="CO₂ Emissions (kg)"))
+st.bar_chart(hist_df, color="#008000")
 
 # 🌆 City-wise Emissions
 if "city" in df.columns:
     st.markdown("### 🌆 City-wise CO₂ Emissions")
-    city_emissions = df.groupby("city")["co2_kg"].sum().sort_values(ascending=False)
+    city_emissions = df.groupby("city", sort=False, observed=True)["co2_kg"].sum().sort_values(ascending=False)
     fig_city, ax_city = plt.subplots()
     city_emissions.plot(kind="bar", ax=ax_city, color="#66BB6A")
     ax_city.set_ylabel("CO₂ (kg)")
     ax_city.set_title("CO₂ by City")
     st.pyplot(fig_city)
 
+# Sample large frames for the map layers; only the positions are sent to the browser
+map_df = df if len(df) <= 20000 else df.sample(20000, random_state=0)
+map_cols = ["poi_lng", "poi_lat"]
+
 # 🗺️ 3D Interactive Delivery Origins (Hexagon Map)
 st.markdown("### 🗺️ 3D Map: Delivery Origins")
 try:
     hex_layer = pdk.Layer(
         "HexagonLayer",
-        data=df,
+        data=map_df[map_cols],
         get_position='[poi_lng, poi_lat]',
         auto_highlight=True,
         radius=700,
@@ -114,7 +158,7 @@ st.markdown("### 🔥 EV Suitability Heatmap")
 try:
     heat_layer = pdk.Layer(
         "HeatmapLayer",
-        data=df[df["suggest_ev"]],
+        data=map_df.loc[map_df["suggest_ev"], map_cols],
         get_position='[poi_lng, poi_lat]',
         opacity=0.8
     )
@@ -129,13 +173,16 @@ except Exception as e:
 # 📈 Forecasting Emissions
 st.markdown("### 📈 Predicted CO₂ Emissions (ML Forecast)")
 try:
-    X = df[["distance_km"]]
-    y = df["co2_kg"]
-    model = LinearRegression().fit(X, y)
-    df["predicted_co2"] = model.predict(X)
+    x = df["distance_km"].to_numpy()
+    y = df["co2_kg"].to_numpy()
+    slope, intercept = _fit_co2_trend(x, y)
+    df["predicted_co2"] = slope * x + intercept
+    # Scatter a sample of the points; the fitted line only needs its two endpoints
+    idx = np.random.default_rng(0).choice(len(x), 5000, replace=False) if len(x) > 5000 else slice(None)
+    xmin, xmax = x.min(), x.max()
     fig_pred, ax_pred = plt.subplots()
-    ax_pred.scatter(X, y, label="Actual", alpha=0.5, color="green")
-    ax_pred.plot(X, df["predicted_co2"], label="Predicted", color="blue")
+    ax_pred.scatter(x[idx], y[idx], label="Actual", alpha=0.5, color="green", rasterized=True)
+    ax_pred.plot([xmin, xmax], [slope * xmin + intercept, slope * xmax + intercept], label="Predicted", color="blue")
     ax_pred.set_xlabel("Distance (km)")
     ax_pred.set_ylabel("CO₂ Emissions (kg)")
     ax_pred.legend()
@@ -146,8 +193,9 @@ except Exception as e:
 # 🏆 Store/Region Leaderboards
 if "store_id" in df.columns:
     st.markdown("### 🏆 Top & Bottom CO₂ Emitting Stores")
-    top = df.groupby("store_id")["co2_kg"].sum().sort_values().head(5)
-    bottom = df.groupby("store_id")["co2_kg"].sum().sort_values().tail(5)
+    store_totals = df.groupby("store_id", sort=False, observed=True)["co2_kg"].sum().sort_values()
+    top = store_totals.head(5)
+    bottom = store_totals.tail(5)
     st.markdown("#### ✅ Top 5 Sustainable Stores")
     st.bar_chart(top)
     st.markdown("#### ❌ Worst 5 Emitting Stores")
@@ -160,7 +208,7 @@ if st.checkbox("💸 Show Estimated Carbon Cost"):
     st.metric("💰 Estimated Carbon Cost", f"₹{total_cost:,.2f}")
 
 # ⬇️ Download Processed Data
-csv = df.to_csv(index=False).encode("utf-8")
+csv = _to_csv_bytes(df)
 st.download_button("⬇️ Download CSV", csv, "greenretailai_data.csv", "text/csv")
 
 # 🧾 Sample Data Preview
@@ -1,13 +1,27 @@
+import math
+import numpy as np
 import pandas as pd
-from geopy.distance import geodesic
+import pyarrow as pa
+import pyarrow.csv as pv
+from numba import njit
 
 # Constants for emissions (in kg per km)
 DIESEL_EMISSION_FACTOR = 0.21
 EV_EMISSION_FACTOR = 0.05
 
+# Mean Earth radius (in km) used by the haversine distance
+EARTH_RADIUS_KM = 6371.0088
+
+# Origin/destination coordinate columns in decimal degrees
+COORD_COLS = ["poi_lat", "poi_lng", "receipt_lat", "receipt_lng"]
+
+# EV priority buckets: distance upper bounds (in km) and the score for each bucket
+EV_PRIORITY_BINS = np.array([5.0, 10.0, 15.0, 20.0, 30.0])
+EV_PRIORITY_SCORES = np.array([1.0, 0.9, 0.7, 0.5, 0.3, 0.1])
+
 def load_delivery_data(path: str = "data/raw/delivery_five_cities.csv", nrows: int = 100000) -> pd.DataFrame:
     """
-    Loads delivery data and converts GPS coordinates from microdegrees to decimal.
+    Loads delivery data and converts GPS coordinates from microdegrees to decimal (float32).
 
     Args:
         path (str): File path to the delivery CSV.
@@ -16,13 +30,30 @@ def load_delivery_data(path: str = "data/raw/delivery_five_cities.csv", nrows: i
     Returns:
         pd.DataFrame: Cleaned dataframe with lat/lng converted.
     """
-    cols = ["poi_lat", "poi_lng", "receipt_lat", "receipt_lng"]
+    cols = COORD_COLS
     try:
-        df = pd.read_csv(path, usecols=cols, nrows=nrows)
+        reader = pv.open_csv(
+            path,
+            read_options=pv.ReadOptions(use_threads=True),
+            convert_options=pv.ConvertOptions(
+                include_columns=cols,
+                column_types={col: pa.float64() for col in cols},
+            ),
+        )
+
+        # Stream record batches until enough rows are parsed
+        batches = []
+        n_read = 0
+        for batch in reader:
+            batches.append(batch)
+            n_read += batch.num_rows
+            if n_read >= nrows:
+                break
+        table = pa.Table.from_batches(batches, schema=reader.schema).slice(0, nrows)
 
         # Convert microdegree coordinates to decimal degrees
-        for col in cols:
-            df[col] = df[col] / 1e6
+        arr = np.column_stack([table[col].to_numpy() for col in cols]) * 1e-6
+        df = pd.DataFrame(arr.astype(np.float32), columns=cols)
 
         return df
     except FileNotFoundError:
@@ -31,9 +62,61 @@ def load_delivery_data(path: str = "data/raw/delivery_five_cities.csv", nrows: i
         raise Exception(f"Error reading delivery data: {e}")
 
 
+def read_uploaded_data(file) -> pd.DataFrame:
+    """
+    Reads an uploaded delivery CSV, keeping only the columns the dashboard uses.
+
+    Coordinates are converted from microdegrees when they are not already in
+    decimal degrees, then stored as float32. City and store columns are read
+    as categoricals.
+
+    Args:
+        file: Path or file-like object with the CSV contents.
+
+    Returns:
+        pd.DataFrame: Dataframe with lat/lng in decimal degrees.
+    """
+    keys = ["city", "store_id"]
+    wanted = set(COORD_COLS + keys)
+    df = pd.read_csv(
+        file,
+        usecols=lambda c: c in wanted,
+        dtype={col: np.float64 for col in COORD_COLS},
+    )
+
+    coords = [col for col in COORD_COLS if col in df.columns]
+    arr = df[coords].to_numpy(dtype=np.float64, copy=True)
+    # Decimal degrees never exceed 180 in magnitude, so larger values are microdegrees
+    if np.nanmax(np.abs(arr), initial=0.0) > 1000:
+        arr = arr * 1e-6
+    for i, col in enumerate(coords):
+        df[col] = arr[:, i].astype(np.float32)
+
+    # Cast after parsing so numeric store IDs keep their integer categories
+    for col in keys:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+
+    return df
+
+
+@njit(fastmath=True, cache=True)
+def _haversine_km(lat1, lon1, lat2, lon2, out):
+    """
+    Writes the haversine distance (in km) for each coordinate pair into out.
+    """
+    for i in range(lat1.shape[0]):
+        phi1 = math.radians(lat1[i])
+        phi2 = math.radians(lat2[i])
+        dphi = phi2 - phi1
+        dlmb = math.radians(lon2[i]) - math.radians(lon1[i])
+        a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+        out[i] = 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
 def compute_distances(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Computes geodesic distance (in km) between origin and destination points.
+    Computes great-circle (haversine) distance (in km) between origin and destination points.
 
     Args:
         df (pd.DataFrame): DataFrame with poi and receipt lat/lng.
@@ -41,16 +124,36 @@ def compute_distances(df: pd.DataFrame) -> pd.DataFrame:
     Returns:
         pd.DataFrame: DataFrame with added 'distance_km' column.
     """
-    df["distance_km"] = df.apply(
-        lambda row: geodesic(
-            (row["poi_lat"], row["poi_lng"]),
-            (row["receipt_lat"], row["receipt_lng"])
-        ).km,
-        axis=1
-    )
+    missing = set(COORD_COLS) - set(df.columns)
+    if missing:
+        raise ValueError(f"Missing coordinate columns: {sorted(missing)}")
+
+    lat1, lon1, lat2, lon2 = (np.ascontiguousarray(df[col].to_numpy()) for col in COORD_COLS)
+    out = np.empty(lat1.shape[0], dtype=np.float32)
+
+    _haversine_km(lat1, lon1, lat2, lon2, out)
+
+    df["distance_km"] = out
     return df
 
 
+@njit(fastmath=True, cache=True)
+def _emissions_kernel(dist, co2, suggest_ev, saving, score):
+    """
+    Fills the emission outputs in a single pass over the distances.
+    """
+    for i in range(dist.shape[0]):
+        d = dist[i]
+        co2[i] = d * DIESEL_EMISSION_FACTOR
+        suggest_ev[i] = d < 10.0
+        saving[i] = d * (DIESEL_EMISSION_FACTOR - EV_EMISSION_FACTOR)
+
+        bucket = 0
+        for j in range(EV_PRIORITY_BINS.shape[0]):
+            bucket += int(d >= EV_PRIORITY_BINS[j])
+        score[i] = EV_PRIORITY_SCORES[bucket]
+
+
 def estimate_emissions(df: pd.DataFrame) -> pd.DataFrame:
     """
     Estimates CO₂ emissions and EV transition potential.
@@ -67,24 +170,17 @@ def estimate_emissions(df: pd.DataFrame) -> pd.DataFrame:
     Returns:
         pd.DataFrame: Enhanced with emission metrics.
     """
-    df["co2_kg"] = df["distance_km"] * DIESEL_EMISSION_FACTOR
-    df["suggest_ev"] = df["distance_km"] < 10
-    df["ev_saving_kg"] = df["distance_km"] * (DIESEL_EMISSION_FACTOR - EV_EMISSION_FACTOR)
-
-    def score_ev_priority(distance):
-        if distance < 5:
-            return 1.0
-        elif distance < 10:
-            return 0.9
-        elif distance < 15:
-            return 0.7
-        elif distance < 20:
-            return 0.5
-        elif distance < 30:
-            return 0.3
-        else:
-            return 0.1
-
-    df["ev_priority_score"] = df["distance_km"].apply(score_ev_priority)
+    dist = np.ascontiguousarray(df["distance_km"].to_numpy(dtype=np.float32))
+    co2 = np.empty_like(dist)
+    suggest_ev = np.empty(dist.shape[0], dtype=np.bool_)
+    saving = np.empty_like(dist)
+    score = np.empty_like(dist)
+
+    _emissions_kernel(dist, co2, suggest_ev, saving, score)
+
+    df["co2_kg"] = co2
+    df["suggest_ev"] = suggest_ev
+    df["ev_saving_kg"] = saving
+    df["ev_priority_score"] = score
 
     return df
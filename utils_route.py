@@ -1,17 +1,16 @@
 import openrouteservice
-from openrouteservice import convert
 
-def get_optimized_route(df, api_key):
+def get_optimized_route(df, api_key, max_waypoints=50):
     try:
-        # Initialize OpenRouteService client
-        client = openrouteservice.Client(key=api_key)
-
-        # Extract coordinates for delivery points
-        coords = df[["poi_lng", "poi_lat"]].values.tolist()
+        # Extract coordinates for delivery points (ORS caps the number of waypoints)
+        coords = df.iloc[:max_waypoints][["poi_lng", "poi_lat"]].to_numpy().tolist()
 
         if len(coords) < 2:
             return None, "Need at least 2 locations for route optimization."
 
+        # Initialize OpenRouteService client
+        client = openrouteservice.Client(key=api_key)
+
         # Format coordinates for optimization
         route = client.directions(coords, profile='driving-car', format='geojson')
 